@@ -1,13 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+import hashlib
 import os
 from pydantic import BaseModel
 from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig
-from .graph import graph, store
-from .personas import persona_manager, detect_persona_request, PERSONAS
-import uuid
+from .graph import graph, store, checkpointer, model_invoker, summarizer
+from .budget import LatencyBudget
+from .traffic import TrafficMiddleware, TRAFFIC_RECORD_PATH
+from .personas import (
+    persona_manager, detect_persona_request, PERSONAS, LRUCache, THREAD_CACHE_SIZE,
+    classifier_invoker, persona_prompt_invoker,
+)
 
 app = FastAPI(title="Persona-Switching Chatbot")
+# Opt-in traffic recording for offline replay (python -m src.replay)
+if TRAFFIC_RECORD_PATH:
+    app.add_middleware(TrafficMiddleware, record_path=TRAFFIC_RECORD_PATH)
+# Compress large payloads such as /chat_history
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Users whose persona threads were already prefetched in this process
+prefetched_users = LRUCache(THREAD_CACHE_SIZE)
 
 class ChatRequest(BaseModel):
     user_id: str
@@ -17,30 +31,44 @@ class ChatHistoryRequest(BaseModel):
     user_id: str
 
 def get_user_threads(user_id: str):
-    """Retrieve user's thread mapping from the store."""
+    """Retrieve user's {persona: thread_id} mapping from the thread index."""
+    user_threads = persona_manager.get_user_threads(user_id)
+    if user_threads:
+        return user_threads
+    # Backfill mappings written by earlier versions to the store
     item = store.get(("config",), f"threads_{user_id}")
-    return item.value if item else {}
-
-def save_user_threads(user_id: str, threads: dict):
-    """Save user's thread mapping to the store."""
-    store.put(("config",), f"threads_{user_id}", threads)
+    legacy_threads = item.value if item else {}
+    for persona, thread_id in legacy_threads.items():
+        persona_manager.bind_thread(thread_id, user_id, persona)
+    return dict(legacy_threads)
+
+def get_active_thread(user_id: str):
+    """Retrieve user's active thread id from the thread index."""
+    return persona_manager.get_active_thread(user_id)
+
+def prefetch_user_threads(user_id: str, user_threads: dict):
+    """Warm the checkpoint cache with the user's persona threads on their first request."""
+    if user_id in prefetched_users:
+        return
+    prefetched_users.put(user_id, True)
+    checkpointer.prefetch(user_threads.values())
 
 @app.post("/chat")
 def chat(request: ChatRequest):
     user_id = request.user_id
     message = request.message
+    budget = LatencyBudget()
 
     # 1. Load persistent thread mapping
     user_threads = get_user_threads(user_id)
-    # Sync with in-memory manager (optional, but good for consistency if we used it elsewhere)
-    persona_manager.user_threads[user_id] = user_threads
+    # Load the other persona threads in the background while the router runs
+    prefetch_user_threads(user_id, user_threads)
 
     # 2. Router Logic
-    target_persona = detect_persona_request(message)
+    target_persona = detect_persona_request(message, budget)
     
     # Determine active thread
-    active_thread_item = store.get(("config",), f"active_thread_{user_id}")
-    active_thread_id = active_thread_item.value if active_thread_item else None
+    active_thread_id = get_active_thread(user_id)
     
     thread_id = None
     persona_name = "Business Domain Expert" # Default
@@ -48,47 +76,25 @@ def chat(request: ChatRequest):
     if target_persona != "base":
         # Switching to specific persona
         persona_name = target_persona.capitalize() # e.g. "Mentor"
-        if persona_name in user_threads:
-            thread_id = user_threads[persona_name]
-        else:
-            thread_id = str(uuid.uuid4())
-            user_threads[persona_name] = thread_id
-            save_user_threads(user_id, user_threads)
-            
-        # Set as active
-        store.put(("config",), f"active_thread_{user_id}", thread_id)
-        persona_manager.thread_personas[thread_id] = persona_name
+        thread_id = user_threads.get(persona_name) or persona_manager.get_or_create_thread(user_id, persona_name)
         
-    else:
+    elif active_thread_id:
         # Continue active thread
-        if active_thread_id:
-            thread_id = active_thread_id
-            # Find persona name
-            for p, t in user_threads.items():
-                if t == thread_id:
-                    persona_name = p
-                    break
-            persona_manager.thread_personas[thread_id] = persona_name
-        else:
-            # No active thread, start default
-            persona_name = "Business Domain Expert"
-            if persona_name in user_threads:
-                thread_id = user_threads[persona_name]
-            else:
-                thread_id = str(uuid.uuid4())
-                user_threads[persona_name] = thread_id
-                save_user_threads(user_id, user_threads)
-            
-            store.put(("config",), f"active_thread_{user_id}", thread_id)
-            persona_manager.thread_personas[thread_id] = persona_name
+        thread_id = active_thread_id
+        persona_name = persona_manager.get_persona_by_thread(thread_id, default=persona_name)
+        
+    else:
+        # No active thread, start default
+        thread_id = user_threads.get(persona_name) or persona_manager.get_or_create_thread(user_id, persona_name)
 
-    # Ensure persona_manager has the mapping
-    persona_manager.thread_personas[thread_id] = persona_name
+    # Set as active
+    persona_manager.set_active_thread(user_id, thread_id)
 
     # 3. Invoke Graph
     config = RunnableConfig(configurable={
         "thread_id": thread_id,
-        "user_id": user_id
+        "user_id": user_id,
+        "budget": budget
     })
 
     # Fast fallback when LLM key is not configured to avoid long network waits during tests
@@ -123,9 +129,33 @@ def chat(request: ChatRequest):
             "error": str(e)
         }
 
+def history_etag(user_id: str, user_threads: dict) -> str:
+    """Weak ETag for a user's history, derived from each thread's latest checkpoint id."""
+    checkpoint_ids = checkpointer.latest_checkpoint_ids(user_threads.values())
+    digest = hashlib.sha1(user_id.encode("utf-8"))
+    for persona, thread_id in sorted(user_threads.items()):
+        digest.update(f"\0{persona}\0{thread_id}\0{checkpoint_ids.get(thread_id, '')}".encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
 @app.get("/chat_history")
-def get_chat_history(user_id: str):
+def get_chat_history(user_id: str, request: Request, response: Response):
     user_threads = get_user_threads(user_id)
+
+    # Let polling clients skip the reload when no thread has a new checkpoint
+    etag = history_etag(user_id, user_threads)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
     history = {}
     
     for persona, thread_id in user_threads.items():
@@ -142,4 +172,17 @@ def get_chat_history(user_id: str):
 
 @app.get("/personas")
 def get_personas():
-    return {"personas": list(PERSONAS.keys())}
\ No newline at end of file
+    return {"personas": list(PERSONAS.keys())}
+
+@app.get("/stats")
+def get_stats():
+    """Model call and checkpoint cache counters for this process."""
+    invokers = (classifier_invoker, persona_prompt_invoker, model_invoker, summarizer.invoker)
+    return {
+        "model_calls": {invoker.name: invoker.snapshot() for invoker in invokers},
+        "checkpoint_cache": {
+            **checkpointer.stats,
+            "entries": len(checkpointer.cache),
+            "bytes": checkpointer.cache.current_bytes,
+        },
+    }
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+from .traffic import record_model_call, replayed_model_call
+
+# Total wall-clock time one /chat request may spend on model calls
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "30"))
+# Deadline for the persona classifier, capped by what is left of the request budget
+CLASSIFIER_TIMEOUT_SECONDS = float(os.getenv("CLASSIFIER_TIMEOUT_SECONDS", "5"))
+# Hedging fires a duplicate call once the primary is slower than the given latency percentile
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Hedge delay used until enough latencies have been observed to compute the percentile
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "2"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# FastAPI runs sync endpoints on anyio's 40 worker threads; leave room for one hedge per request
+MODEL_CALL_WORKERS = int(os.getenv("MODEL_CALL_WORKERS", "80"))
+
+# Shared by all invokers. Each call gets the time left before its deadline as the client's
+# request timeout, so a call the request gave up on is aborted rather than holding a worker.
+_executor = ThreadPoolExecutor(max_workers=MODEL_CALL_WORKERS, thread_name_prefix="model-call")
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _track(future):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+
+    def done(_):
+        global _in_flight
+        with _in_flight_lock:
+            _in_flight -= 1
+
+    future.add_done_callback(done)
+    return future
+
+
+def pool_saturated() -> bool:
+    """True when every model-call worker is busy, so a hedge would only queue."""
+    with _in_flight_lock:
+        return _in_flight >= MODEL_CALL_WORKERS
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a model call does not finish within its deadline."""
+
+
+class LatencyBudget:
+    """Wall-clock budget shared by every model call made for one request."""
+
+    def __init__(self, seconds: float = REQUEST_BUDGET_SECONDS):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class HedgedInvoker:
+    """Runs model calls under a deadline, optionally hedging slow calls with a duplicate."""
+
+    def __init__(self, name: str, hedge: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 initial_delay: float = HEDGE_DELAY_SECONDS, min_samples: int = HEDGE_MIN_SAMPLES,
+                 timeout_kwarg: Optional[str] = "timeout"):
+        self.name = name
+        # Keyword through which the remaining time is passed to the call as its request timeout
+        self.timeout_kwarg = timeout_kwarg
+        self.hedge = hedge
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "timeouts": 0, "errors": 0, "hedges_fired": 0, "hedges_won": 0,
+                      "hedges_skipped": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> dict:
+        """Counters plus the current hedge delay, as reported by the /stats endpoint."""
+        with self._lock:
+            stats = dict(self.stats)
+            samples = len(self._latencies)
+        return {**stats, "latency_samples": samples, "hedge_delay_s": self.hedge_delay()}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait on the primary call before firing a hedge, or None when disabled."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        index = min(len(samples) - 1, int(round(self.percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def invoke(self, fn: Callable, *args, budget: Optional[LatencyBudget] = None,
+               timeout: Optional[float] = None, **kwargs):
+        """Call fn(*args, **kwargs), returning the first result that arrives before the deadline."""
+        self._count("calls")
+        replayed, result = replayed_model_call(self.name)
+        if replayed:
+            return result
+        start = time.monotonic()
+        deadline = budget.deadline if budget else float("inf")
+        if timeout is not None:
+            deadline = min(deadline, start + timeout)
+        if deadline <= start:
+            self._count("timeouts")
+            raise DeadlineExceeded(f"{self.name}: latency budget exhausted")
+
+        def call():
+            # Measured when a worker picks the call up, not when it was queued
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{self.name}: deadline passed before the call started")
+            if self.timeout_kwarg and deadline != float("inf"):
+                return fn(*args, **{**kwargs, self.timeout_kwarg: remaining})
+            return fn(*args, **kwargs)
+
+        def submit():
+            return _track(_executor.submit(call))
+
+        primary = submit()
+        pending = {primary}
+        hedge_at = None
+        delay = self.hedge_delay()
+        if delay is not None:
+            hedge_at = start + delay
+        error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+            wait_for = None if wait_until == float("inf") else max(0.0, wait_until - now)
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is not None:
+                    # Keep waiting on the other call, if any, before giving up
+                    error = future.exception()
+                    continue
+                latency = time.monotonic() - start
+                with self._lock:
+                    self._latencies.append(latency)
+                if future is not primary:
+                    self._count("hedges_won")
+                for other in pending:
+                    other.cancel()
+                record_model_call(self.name, future.result(), latency)
+                return future.result()
+
+            if hedge_at is not None and time.monotonic() >= hedge_at and pending:
+                if pool_saturated():
+                    self._count("hedges_skipped")
+                else:
+                    self._count("hedges_fired")
+                    pending.add(submit())
+                hedge_at = None
+
+        if error is not None and not pending:
+            self._count("errors")
+            raise error
+        for future in pending:
+            future.cancel()
+        # A timed-out call took at least this long; leaving it out would pull the percentile down
+        with self._lock:
+            self._latencies.append(deadline - start)
+        self._count("timeouts")
+        raise DeadlineExceeded(f"{self.name}: no response within {deadline - start:.2f}s")
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Upper bound on the serialized size of the checkpoints kept in memory. This counts the
+# SQLite blob size, not Python object overhead: deserialized messages take several times more.
+CHECKPOINT_CACHE_BYTES = int(os.getenv("CHECKPOINT_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Background workers used to warm the cache for a user's other persona threads
+CHECKPOINT_PREFETCH_WORKERS = int(os.getenv("CHECKPOINT_PREFETCH_WORKERS", "2"))
+
+
+class ByteLRUCache:
+    """Thread-safe LRU mapping bounded by the total size of its values in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self.current_bytes = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key][0]
+
+    def put(self, key, value, size: int):
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._pop(key)
+            return entry[0] if entry else default
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry:
+            self.current_bytes -= entry[1]
+        return entry
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class CachingSqliteSaver(SqliteSaver):
+    """SqliteSaver with an in-memory tier for the latest checkpoint of recently used threads.
+
+    New checkpoints are written through to the cache, so switching back to a thread
+    does not re-read and deserialize its state from SQLite. Pending writes invalidate
+    the cached entry until the next checkpoint lands. A read that misses the cache is
+    inserted under the same lock as writes, so it can never replace a newer checkpoint
+    or resurrect an entry that pending writes invalidated.
+    """
+
+    def __init__(self, conn, *, max_bytes: int = CHECKPOINT_CACHE_BYTES,
+                 prefetch_workers: int = CHECKPOINT_PREFETCH_WORKERS, **kwargs):
+        super().__init__(conn, **kwargs)
+        # (thread_id, checkpoint_ns) -> latest CheckpointTuple
+        self.cache = ByteLRUCache(max_bytes)
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0}
+        # Held across a SQLite write and its cache update, and across a miss and its insert.
+        # SqliteSaver already serializes all access to the connection, so this costs no concurrency.
+        self._cache_lock = threading.Lock()
+        self._prefetch_pool = ThreadPoolExecutor(
+            max_workers=max(1, prefetch_workers), thread_name_prefix="checkpoint-prefetch"
+        )
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+    def _copy(self, saved: CheckpointTuple) -> CheckpointTuple:
+        return saved._replace(checkpoint=copy_checkpoint(saved.checkpoint))
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        key = self._key(config)
+        checkpoint_id = get_checkpoint_id(config)
+        cached = self.cache.get(key)
+        if cached is not None and checkpoint_id in (None, cached.checkpoint["id"]):
+            self.stats["hits"] += 1
+            return self._copy(cached)
+
+        self.stats["misses"] += 1
+        if checkpoint_id is not None:
+            return super().get_tuple(config)
+        with self._cache_lock:
+            saved = super().get_tuple(config)
+            if saved is None:
+                return None
+            self.cache.put(key, saved, self._stored_size(saved.config))
+        return self._copy(saved)
+
+    def _stored_size(self, config: RunnableConfig) -> int:
+        """Size of a stored checkpoint blob, read from SQLite instead of re-serializing it."""
+        configurable = config["configurable"]
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT length(checkpoint) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]),
+            )
+            row = cur.fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        # Same write as SqliteSaver.put, but keeps the serialized blob to size the cache entry
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        checkpoint_metadata = get_checkpoint_metadata(config, metadata)
+        serialized_metadata = json.dumps(checkpoint_metadata, ensure_ascii=False).encode("utf-8", "ignore")
+        next_config = {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+        saved = CheckpointTuple(
+            next_config,
+            copy_checkpoint(checkpoint),
+            checkpoint_metadata,
+            {"configurable": {**next_config["configurable"], "checkpoint_id": parent_id}} if parent_id else None,
+            [],
+        )
+        with self._cache_lock:
+            with self.cursor() as cur:
+                cur.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(thread_id), checkpoint_ns, checkpoint["id"], parent_id, type_, serialized_checkpoint, serialized_metadata),
+                )
+            self.cache.put(self._key(next_config), saved, len(serialized_checkpoint))
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with self._cache_lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self.cache.pop(self._key(config))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._cache_lock:
+            super().delete_thread(thread_id)
+            self.cache.pop((str(thread_id), ""))
+
+    def latest_checkpoint_ids(self, thread_ids: Iterable[str]) -> Dict[str, str]:
+        """Return {thread_id: latest checkpoint_id} without loading any checkpoint."""
+        thread_ids = [str(thread_id) for thread_id in thread_ids]
+        if not thread_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in thread_ids)
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                f"SELECT thread_id, MAX(checkpoint_id) FROM checkpoints WHERE checkpoint_ns = '' AND thread_id IN ({placeholders}) GROUP BY thread_id",
+                thread_ids,
+            )
+            return dict(cur.fetchall())
+
+    def prefetch(self, thread_ids: Iterable[str]):
+        """Load the latest checkpoint of each thread into the cache in the background."""
+        futures = []
+        for thread_id in thread_ids:
+            if (str(thread_id), "") in self.cache:
+                continue
+            futures.append(self._prefetch_pool.submit(self._prefetch_one, thread_id))
+        return futures
+
+    def _prefetch_one(self, thread_id: str):
+        try:
+            if self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}) is not None:
+                self.stats["prefetched"] += 1
+        except Exception as e:
+            print(f"[CheckpointCache] Prefetch failed for thread {thread_id}: {e}")
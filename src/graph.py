@@ -1,5 +1,4 @@
 from langgraph.store.sqlite import SqliteStore
-from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain.chat_models import init_chat_model
 from langchain.tools import tool
 from langchain_core.runnables import RunnableConfig
@@ -9,6 +8,9 @@ from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 import sqlite3
 from dotenv import load_dotenv
 from .personas import persona_manager, PERSONAS
+from .checkpoint_cache import CachingSqliteSaver
+from .budget import HedgedInvoker, LatencyBudget
+from .summaries import ThreadSummarizer
 
 load_dotenv()
 
@@ -20,7 +22,8 @@ current_user_id = None
 # Create checkpointer and store
 # check_same_thread=False is recommended for multi-threaded environments (like web apps)
 conn = sqlite3.connect("checkpoints.sqlite", check_same_thread=False)
-checkpointer = SqliteSaver(conn)
+# Recently used thread states are served from memory (see CHECKPOINT_CACHE_BYTES)
+checkpointer = CachingSqliteSaver(conn)
 
 # Dedicated SQLite store to persist procedural/user memory across runs
 store_conn = sqlite3.connect("store.sqlite", check_same_thread=False, isolation_level=None)
@@ -79,14 +82,27 @@ store.setup()
 model = init_chat_model(
     "gpt-4.1-mini", 
     temperature=0,
-    max_tokens=1000
+    max_tokens=1000,
+    # Calls are bounded by the request budget (passed as timeout); retries would outlive it
+    max_retries=0
 )
 tools = []
 # tools = [multiply, add, save_user_info, get_user_info, update_instructions]
 llm_with_tools = model.bind_tools(tools)
 tools_by_name = {tool.name: tool for tool in tools}
 
-def trim_messages(messages, max_messages=10):
+# Deadline and hedging for generation calls
+model_invoker = HedgedInvoker("generation")
+
+# Messages beyond the most recent MAX_CONTEXT_MESSAGES are folded into the thread summary
+MAX_CONTEXT_MESSAGES = 10
+# Hard cap on messages sent alongside the summary, in case summarization falls behind
+MAX_PROMPT_MESSAGES = 30
+
+# Rolling summaries of messages that fell out of the context window
+summarizer = ThreadSummarizer(store, model, MAX_CONTEXT_MESSAGES)
+
+def trim_messages(messages, max_messages=MAX_CONTEXT_MESSAGES):
     if len(messages) <= max_messages:
         return messages
     return messages[-max_messages:]
@@ -118,18 +134,32 @@ def llm_call(state: MessagesState, config: RunnableConfig):
     
     system_content += f"\n\nUser profile: {profile_str}"
     system_content += f"\n\nCurrent Persona: {persona_name}"
+
+    # Summary of older turns, kept up to date in the background
+    thread_summary = summarizer.get(thread_id)
+    if thread_summary["summary"]:
+        system_content += f"\n\nSummary of earlier conversation in this thread:\n{thread_summary['summary']}"
     system_content += "\n\nNote: Use the conversation history to answer questions about previous interactions. Only use tools if you need to perform a specific action or retrieve data not present in the chat."
     
-    # Trim messages for short-term memory management
-    trimmed_messages = trim_messages(state["messages"])
+    # Send every message not yet in the summary, so nothing falls between summary and window
+    summarized_count = thread_summary["summarized_count"]
+    if summarized_count > len(state["messages"]):
+        summarized_count = 0
+    trimmed_messages = trim_messages(state["messages"][summarized_count:], MAX_PROMPT_MESSAGES)
+    summarizer.schedule(thread_id, state["messages"], thread_summary)
+
+    # Shared with the classifier so the whole request stays within one latency budget
+    budget = config["configurable"].get("budget") or LatencyBudget()
     
     return {
         "messages": [
-            llm_with_tools.invoke(
+            model_invoker.invoke(
+                llm_with_tools.invoke,
                 [
                     SystemMessage(content=system_content)
                 ]
-                + trimmed_messages
+                + trimmed_messages,
+                budget=budget,
             )
         ]
     }
@@ -1,11 +1,18 @@
+import os
 import uuid
 import sqlite3
-from typing import Dict, Optional, Literal, get_args
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Literal, Tuple, get_args
 from pydantic import BaseModel, Field, model_validator
 from langchain_openai import ChatOpenAI
+from .budget import CLASSIFIER_TIMEOUT_SECONDS, DeadlineExceeded, HedgedInvoker, LatencyBudget
 
 DB_PATH = "personas.db"
 
+# Number of thread -> (user_id, persona) entries kept in memory in front of the thread index
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "1024"))
+
 # Define default personas for seeding
 DEFAULT_PERSONAS: Dict[str, str] = {
     "base": "You are a Business Domain Expert capable of assuming various professional roles. Adapt your responses based on the requested persona.",
@@ -49,6 +56,11 @@ def save_persona_to_db(name: str, prompt: str):
     conn.commit()
     conn.close()
 
+# Deadline and hedging for intent classification calls
+classifier_invoker = HedgedInvoker("classifier")
+# Persona prompt generation is rare and unbounded, but routed through an invoker so it can be recorded
+persona_prompt_invoker = HedgedInvoker("persona_prompt", hedge=False)
+
 # Initialize DB and load personas into memory
 init_personas_db()
 PERSONAS: Dict[str, str] = load_personas()
@@ -81,9 +93,9 @@ class PersonaDecision(BaseModel):
                 raise ValueError(f"Invalid persona: {self.target_persona}. Must be one of {list(PERSONAS.keys())}")
         return self
 
-def generate_new_persona_prompt(name: str, description: str) -> str:
-    """Generate a system prompt for a new persona using an LLM."""
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+def generate_new_persona_prompt(name: str, description: str, budget: Optional[LatencyBudget] = None) -> str:
+    """Generate a system prompt for a new persona using an LLM, within the request budget."""
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7, max_retries=0)
     prompt = f"""
 Generate a concise system prompt to be used as the agent's system instructions.
 
@@ -98,12 +110,18 @@ Context (use this to make the prompt relevant): this project implements a Person
 
 Return only the system prompt text (including the final "Example:" line). Do NOT include any additional commentary.
 """
-    response = llm.invoke(prompt)
+    response = persona_prompt_invoker.invoke(llm.invoke, prompt, budget=budget)
     return str(response.content)
 
-def detect_persona_request(message: str) -> str:
-    """Detect intent, handle persona creation if needed, and return the target persona name."""
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0)
+def detect_persona_request(message: str, budget: Optional[LatencyBudget] = None) -> str:
+    """Detect intent, handle persona creation if needed, and return the target persona name.
+
+    The classifier call is bounded by CLASSIFIER_TIMEOUT_SECONDS and the request budget,
+    and generating a new persona's prompt by what is left of the budget; when either misses
+    its deadline the request continues with the active persona.
+    """
+    # The invoker passes the remaining budget as the request timeout; retries would outlive it
+    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0, max_retries=0)
     structured_llm = llm.with_structured_output(PersonaDecision)
     
     available_personas = ", ".join(PERSONAS.keys())
@@ -152,10 +170,15 @@ def detect_persona_request(message: str) -> str:
     """
 
     try:
-        decision = structured_llm.invoke([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ])
+        decision = classifier_invoker.invoke(
+            structured_llm.invoke,
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": message}
+            ],
+            budget=budget,
+            timeout=CLASSIFIER_TIMEOUT_SECONDS,
+        )
         
         # Handle potential dict return from structured_llm
         if isinstance(decision, dict):
@@ -179,7 +202,7 @@ def detect_persona_request(message: str) -> str:
             
             description = new_persona_description or f"A {name} persona."
             print(f"Creating new persona: {name}")
-            new_prompt = generate_new_persona_prompt(name, description)
+            new_prompt = generate_new_persona_prompt(name, description, budget)
             PERSONAS[name] = new_prompt
             save_persona_to_db(name, new_prompt)
             return name
@@ -187,42 +210,189 @@ def detect_persona_request(message: str) -> str:
         else: # continue
             return "base"
             
+    except DeadlineExceeded as e:
+        print(f"Persona detection timed out, continuing: {e}")
+        return "base"
     except Exception as e:
         print(f"Error in persona detection: {e}")
         return "base"
 
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(0, maxsize)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class ThreadIndex:
+    """Persistent thread_id -> (user_id, persona) table with an LRU cache in front of it."""
+
+    def __init__(self, db_path: str = DB_PATH, cache_size: int = THREAD_CACHE_SIZE):
+        # check_same_thread=False because FastAPI runs sync endpoints on a worker pool
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.cache = LRUCache(cache_size)
+        self.setup()
+
+    def setup(self):
+        with self._lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS thread_personas (
+                    thread_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    persona TEXT NOT NULL,
+                    UNIQUE (user_id, persona)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS active_threads (
+                    user_id TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL
+                )
+            ''')
+            self.conn.commit()
+
+    def get(self, thread_id: str) -> Optional[Tuple[str, str]]:
+        """Return (user_id, persona) for a thread, or None if the thread is unknown."""
+        entry = self.cache.get(thread_id)
+        if entry is not None:
+            return entry
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT user_id, persona FROM thread_personas WHERE thread_id = ?', (thread_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], row[1])
+        self.cache.put(thread_id, entry)
+        return entry
+
+    def put(self, thread_id: str, user_id: str, persona: str):
+        entry = (user_id, persona)
+        if self.cache.get(thread_id) == entry:
+            return
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO thread_personas (thread_id, user_id, persona) VALUES (?, ?, ?)',
+                (thread_id, user_id, persona)
+            )
+            self.conn.commit()
+        self.cache.put(thread_id, entry)
+
+    def threads_for_user(self, user_id: str) -> Dict[str, str]:
+        """Return the user's {persona_name: thread_id} mapping."""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT persona, thread_id FROM thread_personas WHERE user_id = ? ORDER BY rowid', (user_id,)
+            ).fetchall()
+        return {persona: thread_id for persona, thread_id in rows}
+
+    def get_or_create(self, user_id: str, persona: str, thread_id: str) -> str:
+        """Bind thread_id to (user_id, persona) unless another thread already won; return the bound thread."""
+        with self._lock:
+            self.conn.execute(
+                'INSERT INTO thread_personas (thread_id, user_id, persona) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id, persona) DO NOTHING',
+                (thread_id, user_id, persona)
+            )
+            self.conn.commit()
+            winner = self.conn.execute(
+                'SELECT thread_id FROM thread_personas WHERE user_id = ? AND persona = ?', (user_id, persona)
+            ).fetchone()[0]
+        self.cache.put(winner, (user_id, persona))
+        return winner
+
+    def get_active(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT thread_id FROM active_threads WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_active(self, user_id: str, thread_id: str):
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO active_threads (user_id, thread_id) VALUES (?, ?)', (user_id, thread_id)
+            )
+            self.conn.commit()
+
+
 class PersonaManager:
-    def __init__(self):
-        # user_id -> {persona_name: thread_id}
-        self.user_threads = {}
-        # user_id -> active_thread_id
-        self.active_threads = {}
-        # thread_id -> persona_name
-        self.thread_personas = {}
+    def __init__(self, db_path: str = DB_PATH, cache_size: int = THREAD_CACHE_SIZE):
+        # thread_id -> (user_id, persona_name), persisted with an LRU front cache
+        self.threads = ThreadIndex(db_path, cache_size)
+        # user_id -> active_thread_id, front cache for the persisted active_threads table
+        self.active_threads = LRUCache(cache_size)
+
+    def get_user_threads(self, user_id: str) -> Dict[str, str]:
+        return self.threads.threads_for_user(user_id)
+
+    def bind_thread(self, thread_id: str, user_id: str, persona_name: str):
+        self.threads.put(thread_id, user_id, persona_name)
 
     def get_or_create_thread(self, user_id: str, persona_name: str) -> str:
-        if user_id not in self.user_threads:
-            self.user_threads[user_id] = {}
-        
-        if persona_name not in self.user_threads[user_id]:
-            # Create new thread ID
-            thread_id = str(uuid.uuid4())
-            self.user_threads[user_id][persona_name] = thread_id
-            self.thread_personas[thread_id] = persona_name
-            print(f"[PersonaManager] Created new thread {thread_id} for persona '{persona_name}'")
-        
-        return self.user_threads[user_id][persona_name]
+        user_threads = self.get_user_threads(user_id)
+        if persona_name in user_threads:
+            return user_threads[persona_name]
+
+        # Create new thread ID; a concurrent request may have created one first
+        thread_id = self.threads.get_or_create(user_id, persona_name, str(uuid.uuid4()))
+        print(f"[PersonaManager] Using thread {thread_id} for persona '{persona_name}'")
+        return thread_id
 
     def set_active_thread(self, user_id: str, thread_id: str):
-        self.active_threads[user_id] = thread_id
-        persona = self.thread_personas.get(thread_id, "Unknown")
+        if self.get_active_thread(user_id) == thread_id:
+            return
+        self.threads.set_active(user_id, thread_id)
+        self.active_threads.put(user_id, thread_id)
+        persona = self.get_persona_by_thread(thread_id, default="Unknown")
         print(f"[PersonaManager] Switched active thread to {thread_id} (Persona: {persona})")
 
     def get_active_thread(self, user_id: str) -> Optional[str]:
-        return self.active_threads.get(user_id)
+        thread_id = self.active_threads.get(user_id)
+        if thread_id is None:
+            thread_id = self.threads.get_active(user_id)
+            if thread_id is not None:
+                self.active_threads.put(user_id, thread_id)
+        return thread_id
 
-    def get_persona_by_thread(self, thread_id: str) -> str:
-        return self.thread_personas.get(thread_id, "base")
+    def get_persona_by_thread(self, thread_id: str, default: str = "base") -> str:
+        entry = self.threads.get(thread_id)
+        return entry[1] if entry else default
 
 # Initialize global manager
-persona_manager = PersonaManager()
\ No newline at end of file
+persona_manager = PersonaManager()
@@ -0,0 +1,181 @@
+"""Replay recorded /chat and /chat_history traffic against the app, fully offline.
+
+Record traffic by starting the server with TRAFFIC_RECORD_PATH=traffic.jsonl, then:
+
+    python -m src.replay traffic.jsonl --speed 4 --out run.json
+    python -m src.replay traffic.jsonl --out run2.json --compare run.json
+
+Model calls are answered from the recording, and the app runs against fresh
+SQLite files in a temporary directory, so nothing touches the network or real data.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+REPORT_PERCENTILES = (50, 90, 99)
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    # Skip lines that are not traffic records (e.g. other JSONL content)
+    return sorted((e for e in entries if "path" in e and "ts" in e), key=lambda e: e["ts"])
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """Per-endpoint count, mean, percentiles and max of latencies in milliseconds."""
+    summary = {}
+    for endpoint, values in sorted(latencies.items()):
+        stats = {"count": len(values), "mean": round(sum(values) / len(values), 3) if values else 0.0}
+        for pct in REPORT_PERCENTILES:
+            stats[f"p{pct}"] = round(percentile(values, pct), 3)
+        stats["max"] = round(max(values), 3) if values else 0.0
+        summary[endpoint] = stats
+    return summary
+
+
+def diff_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Compare the latency summaries of two runs, endpoint by endpoint."""
+    diff = {}
+    for endpoint, stats in current["latency_ms"].items():
+        base_stats = baseline["latency_ms"].get(endpoint)
+        if not base_stats:
+            continue
+        diff[endpoint] = {}
+        for metric in ("mean", *(f"p{pct}" for pct in REPORT_PERCENTILES), "max"):
+            before, after = base_stats[metric], stats[metric]
+            change = round((after - before) / before * 100, 1) if before else None
+            diff[endpoint][metric] = {"baseline": before, "current": after, "change_pct": change}
+    return diff
+
+
+def replay(entries: List[Dict[str, Any]], app, speed: float = 1.0, workers: int = 8,
+           model_latency: bool = False) -> Dict[str, Any]:
+    """Send the recorded requests to app at their original pacing divided by speed."""
+    from fastapi.testclient import TestClient
+    from .traffic import REPLAY_HEADER, TrafficMiddleware
+
+    replay_book = {
+        entry["id"]: [
+            {**call, "latency_ms": call.get("latency_ms", 0) if model_latency else 0}
+            for call in entry.get("model_calls", [])
+        ]
+        for entry in entries
+    }
+    app.add_middleware(TrafficMiddleware, replay_book=replay_book)
+
+    latencies: Dict[str, List[float]] = {}
+    mismatches = []
+    # Last ETag the replay client received per (user, path), sent back on conditional polls
+    etags: Dict[tuple, str] = {}
+
+    def user_of(entry):
+        body = entry.get("body") or {}
+        query = dict(parse_qsl(entry.get("query") or ""))
+        return body.get("user_id") or query.get("user_id")
+
+    def send(client, entry, previous):
+        # A user's requests are sequential in real traffic: wait for the previous one
+        if previous is not None:
+            previous.result()
+        url = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+        headers = {REPLAY_HEADER: entry["id"]}
+        etag_key = (user_of(entry), entry["path"])
+        if entry.get("conditional") and etag_key in etags:
+            headers["If-None-Match"] = etags[etag_key]
+        start = time.perf_counter()
+        response = client.request(entry["method"], url, json=entry.get("body"), headers=headers)
+        latency = (time.perf_counter() - start) * 1000
+        latencies.setdefault(entry["path"], []).append(latency)
+        if "etag" in response.headers:
+            etags[etag_key] = response.headers["etag"]
+
+        recorded = entry.get("response") or {}
+        replayed = response.json() if response.content else {}
+        if response.status_code != entry["status"] or recorded.get("persona") != replayed.get("persona"):
+            mismatches.append({
+                "id": entry["id"],
+                "path": entry["path"],
+                "recorded": {"status": entry["status"], "persona": recorded.get("persona")},
+                "replayed": {"status": response.status_code, "persona": replayed.get("persona")},
+            })
+
+    with TestClient(app) as client, ThreadPoolExecutor(max_workers=workers) as pool:
+        t0 = entries[0]["ts"] if entries else 0
+        start = time.monotonic()
+        futures = []
+        last_by_user = {}
+        for entry in entries:
+            delay = (entry["ts"] - t0) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            user_id = user_of(entry)
+            future = pool.submit(send, client, entry, last_by_user.get(user_id))
+            last_by_user[user_id] = future
+            futures.append(future)
+        for future in futures:
+            future.result()
+        elapsed = time.monotonic() - start
+
+    recorded_latencies: Dict[str, List[float]] = {}
+    for entry in entries:
+        recorded_latencies.setdefault(entry["path"], []).append(entry["latency_ms"])
+
+    return {
+        "requests": len(entries),
+        "speed": speed,
+        "elapsed_s": round(elapsed, 3),
+        "latency_ms": latency_summary(latencies),
+        "recorded_latency_ms": latency_summary(recorded_latencies),
+        "mismatches": mismatches,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay recorded chatbot traffic offline.")
+    parser.add_argument("recording", help="JSONL file written with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor (default: 1, original pacing)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent client connections")
+    parser.add_argument("--model-latency", action="store_true", help="Sleep for the recorded model latency")
+    parser.add_argument("--out", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous report to diff this run against")
+    args = parser.parse_args(argv)
+
+    entries = load_recording(args.recording)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    out_path = os.path.abspath(args.out) if args.out else None
+
+    # The app opens its SQLite files relative to the working directory at import time
+    os.chdir(tempfile.mkdtemp(prefix="replay-"))
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    from .api import app
+
+    report = replay(entries, app, speed=args.speed, workers=args.workers, model_latency=args.model_latency)
+    if baseline:
+        report["diff"] = diff_reports(baseline, report)
+
+    output = json.dumps(report, indent=2)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
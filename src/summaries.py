@@ -0,0 +1,86 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Sequence
+from langchain_core.messages import BaseMessage
+from .budget import HedgedInvoker
+from .traffic import track_background_work
+
+# Fold messages into the summary only once this many have fallen out of the context window
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "4"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+# Deadline for one summarization call, so a hung provider cannot stall the workers
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "60"))
+
+SUMMARY_NAMESPACE = ("summaries",)
+
+
+class ThreadSummarizer:
+    """Keeps a rolling summary of the messages that fell out of a thread's context window.
+
+    Summaries live in the store under ("summaries", thread_id) next to the thread's
+    checkpoints and are updated on a background pool, off the request path.
+    """
+
+    def __init__(self, store, model, max_messages: int,
+                 min_new_messages: int = SUMMARY_MIN_NEW_MESSAGES, workers: int = SUMMARY_WORKERS):
+        self.store = store
+        self.model = model
+        self.max_messages = max_messages
+        self.min_new_messages = max(1, min_new_messages)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="summarizer")
+        self.invoker = HedgedInvoker("summary", hedge=False)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str) -> dict:
+        """Return {"summary": str, "summarized_count": int} for the thread."""
+        item = self.store.get(SUMMARY_NAMESPACE, thread_id)
+        return item.value if item else {"summary": "", "summarized_count": 0}
+
+    def schedule(self, thread_id: str, messages: Sequence[BaseMessage],
+                 current: Optional[dict] = None) -> Optional[Future]:
+        """Fold newly out-of-window messages into the summary in the background, if due."""
+        cutoff = len(messages) - self.max_messages
+        current = current or self.get(thread_id)
+        if cutoff - current["summarized_count"] < self.min_new_messages:
+            return None
+        with self._lock:
+            if thread_id in self._in_flight:
+                return None
+            self._in_flight.add(thread_id)
+        # Carry the request context so the call is recorded with the request and served from it on replay
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, self._fold, thread_id, list(messages[:cutoff]))
+        track_background_work(future)
+        return future
+
+    def _fold(self, thread_id: str, messages: Sequence[BaseMessage]) -> dict:
+        try:
+            current = self.get(thread_id)
+            new_messages = messages[current["summarized_count"]:]
+            if not new_messages:
+                return current
+            transcript = "\n".join(f"{msg.type}: {msg.content}" for msg in new_messages)
+            prompt = f"""Update the running summary of a conversation with the new messages below.
+
+Keep the user's goals, facts they shared, decisions, advice given and open questions.
+Be concise (at most 10 short bullet points) and return only the updated summary.
+
+Current summary:
+{current["summary"] or "(empty)"}
+
+New messages:
+{transcript}
+"""
+            response = self.invoker.invoke(self.model.invoke, prompt, timeout=SUMMARY_TIMEOUT_SECONDS)
+            value = {"summary": str(response.content), "summarized_count": len(messages)}
+            self.store.put(SUMMARY_NAMESPACE, thread_id, value)
+            return value
+        except Exception as e:
+            print(f"[ThreadSummarizer] Failed to summarize thread {thread_id}: {e}")
+            return self.get(thread_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(thread_id)
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Opt-in: append anonymized /chat and /chat_history traffic to this JSONL file
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+# Salt for hashing user ids in recordings
+TRAFFIC_RECORD_SALT = os.getenv("TRAFFIC_RECORD_SALT", "")
+RECORDED_PATHS = ("/chat", "/chat_history")
+# Header the replay tool uses to tell the app which recorded exchange it is replaying
+REPLAY_HEADER = "x-replay-id"
+# How long an entry waits for background model calls its request started (e.g. summaries)
+TRAFFIC_BACKGROUND_WAIT_SECONDS = float(os.getenv("TRAFFIC_BACKGROUND_WAIT_SECONDS", "120"))
+# Free text in /chat bodies and responses, recorded as same-length placeholders
+TEXT_FIELDS = ("message", "response")
+# Structured model output the replay needs verbatim to make the same routing decisions
+ROUTING_FIELDS = ("action", "target_persona", "new_persona_name")
+
+# Model calls made while serving the current request (recording) or still to be served (replay)
+_recorded_calls: ContextVar[Optional[list]] = ContextVar("recorded_calls", default=None)
+_replay_calls: ContextVar[Optional[deque]] = ContextVar("replay_calls", default=None)
+# Futures of background work started while serving the request being recorded
+_background_work: ContextVar[Optional[list]] = ContextVar("background_work", default=None)
+# Background work started by a request (e.g. summaries) shares its context with the request
+_calls_lock = threading.Lock()
+
+
+def anonymize_user_id(user_id: str, salt: str = TRAFFIC_RECORD_SALT) -> str:
+    return "user_" + hashlib.sha256(f"{salt}{user_id}".encode("utf-8")).hexdigest()[:16]
+
+
+def dump_model_result(result: Any) -> Dict[str, Any]:
+    """Serialize a model call result to JSON-compatible data."""
+    if isinstance(result, BaseMessage):
+        return {"kind": "message", "data": message_to_dict(result)}
+    if isinstance(result, BaseModel):
+        # Structured outputs are replayed as dicts, which callers already accept
+        return {"kind": "dict", "data": result.model_dump()}
+    return {"kind": "raw", "data": result}
+
+
+def load_model_result(dumped: Dict[str, Any]) -> Any:
+    if dumped["kind"] == "message":
+        return messages_from_dict([dumped["data"]])[0]
+    return dumped["data"]
+
+
+def redact_text(value: Any) -> Any:
+    """Replace every string in value with a placeholder of the same length."""
+    if isinstance(value, str):
+        return "x" * len(value)
+    if isinstance(value, list):
+        return [redact_text(item) for item in value]
+    if isinstance(value, dict):
+        return {key: redact_text(item) for key, item in value.items()}
+    return value
+
+
+def redact_model_result(dumped: Dict[str, Any]) -> Dict[str, Any]:
+    """Redact the text of a dumped model result, keeping what replay needs to route requests."""
+    data = dumped["data"]
+    if dumped["kind"] == "message":
+        message = dict(data["data"])
+        content = message.get("content")
+        if isinstance(content, list):
+            # Content blocks keep their type, only their text is replaced
+            message["content"] = [
+                {**block, "text": redact_text(block.get("text", ""))} if isinstance(block, dict) else redact_text(block)
+                for block in content
+            ]
+        else:
+            message["content"] = redact_text(content)
+        for key in ("tool_calls", "invalid_tool_calls"):
+            if message.get(key):
+                message[key] = [{**call, "args": redact_text(call.get("args"))} for call in message[key]]
+        # Raw provider payloads repeat the content and tool call arguments
+        message["additional_kwargs"] = {}
+        return {"kind": "message", "data": {**data, "data": message}}
+    if dumped["kind"] == "dict" and isinstance(data, dict):
+        return {"kind": "dict", "data": {
+            key: value if key in ROUTING_FIELDS else redact_text(value) for key, value in data.items()
+        }}
+    return {"kind": dumped["kind"], "data": redact_text(data)}
+
+
+def record_model_call(name: str, result: Any, latency: float):
+    """Attach a model call to the request being recorded, if any."""
+    calls = _recorded_calls.get()
+    if calls is not None:
+        call = {"name": name, "latency_ms": round(latency * 1000, 3),
+                "result": redact_model_result(dump_model_result(result))}
+        with _calls_lock:
+            calls.append(call)
+
+
+def replayed_model_call(name: str) -> Tuple[bool, Any]:
+    """Return (True, result) when the current request is a replay, serving the recorded call."""
+    calls = _replay_calls.get()
+    if calls is None:
+        return False, None
+    with _calls_lock:
+        call = next((c for c in calls if c["name"] == name), None)
+        if call is not None:
+            calls.remove(call)
+    if call is None:
+        # Never fall through to the real provider while replaying
+        raise LookupError(f"No recorded '{name}' model response for this request")
+    # Only set when the replay simulates the original model latency
+    if call.get("latency_ms"):
+        time.sleep(call["latency_ms"] / 1000)
+    return True, load_model_result(call["result"])
+
+
+def track_background_work(future):
+    """Have the recorder wait for future before writing the current request's entry."""
+    work = _background_work.get()
+    if work is not None:
+        with _calls_lock:
+            work.append(future)
+
+
+def _anonymize_body(data: Any, salt: str) -> Any:
+    if not isinstance(data, dict):
+        return data
+    data = {key: redact_text(value) if key in TEXT_FIELDS else value for key, value in data.items()}
+    if isinstance(data.get("user_id"), str):
+        data["user_id"] = anonymize_user_id(data["user_id"], salt)
+    return data
+
+
+class TrafficMiddleware(BaseHTTPMiddleware):
+    """Records /chat and /chat_history exchanges, or serves model calls from a recording.
+
+    With record_path set, each exchange is appended to the JSONL file with anonymized
+    user ids, its latency and the model responses produced while serving it, including
+    background summaries it started. Message and response text is replaced by same-length
+    placeholders and /chat_history bodies are reduced to their size. With
+    replay_book set ({exchange_id: model_calls}), requests carrying REPLAY_HEADER get
+    their model calls answered from the book instead of the provider.
+    """
+
+    def __init__(self, app, record_path: Optional[str] = None,
+                 replay_book: Optional[Dict[str, list]] = None, salt: str = TRAFFIC_RECORD_SALT):
+        super().__init__(app)
+        self.record_path = record_path
+        self.replay_book = replay_book
+        self.salt = salt
+        self._lock = threading.Lock()
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path not in RECORDED_PATHS:
+            return await call_next(request)
+        if self.replay_book is not None:
+            return await self._replay(request, call_next)
+        if self.record_path:
+            return await self._record(request, call_next)
+        return await call_next(request)
+
+    async def _replay(self, request: Request, call_next):
+        calls = deque(self.replay_book.get(request.headers.get(REPLAY_HEADER, ""), []))
+        token = _replay_calls.set(calls)
+        try:
+            return await call_next(request)
+        finally:
+            _replay_calls.reset(token)
+
+    async def _record(self, request: Request, call_next):
+        body = await request.body()
+        calls, background = [], []
+        token = _recorded_calls.set(calls)
+        background_token = _background_work.set(background)
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+            content = b"".join([chunk async for chunk in response.body_iterator])
+        finally:
+            _recorded_calls.reset(token)
+            _background_work.reset(background_token)
+        latency = time.perf_counter() - start
+
+        query = [
+            (key, anonymize_user_id(value, self.salt) if key == "user_id" else value)
+            for key, value in parse_qsl(request.url.query, keep_blank_values=True)
+        ]
+        entry = {
+            "id": uuid.uuid4().hex,
+            "ts": started_at,
+            "method": request.method,
+            "path": request.url.path,
+            "query": urlencode(query),
+            "body": _anonymize_body(_json_or_none(body), self.salt),
+            # ETags name thread versions that will not exist on replay; only note that one was sent
+            "conditional": "if-none-match" in request.headers,
+            "status": response.status_code,
+            "latency_ms": round(latency * 1000, 3),
+            "response": self._recorded_response(request.url.path, content),
+        }
+        # Written after the response is sent, once the request's background model calls are in
+        return Response(content=content, status_code=response.status_code,
+                        headers=response.headers, media_type=response.media_type,
+                        background=BackgroundTask(self._write_entry, entry, calls, background))
+
+    async def _write_entry(self, entry: dict, calls: list, background: list):
+        pending = [asyncio.wrap_future(future) for future in self._snapshot(background)]
+        if pending:
+            await asyncio.wait(pending, timeout=TRAFFIC_BACKGROUND_WAIT_SECONDS)
+        entry["model_calls"] = self._snapshot(calls)
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _recorded_response(self, path: str, content: bytes) -> Any:
+        # History responses grow with every poll and are never replayed; keep only their size
+        if path == "/chat_history":
+            return {"size": len(content)}
+        return _anonymize_body(_json_or_none(content), self.salt)
+
+    @staticmethod
+    def _snapshot(calls: list) -> list:
+        with _calls_lock:
+            return list(calls)
+
+
+def _json_or_none(raw: bytes) -> Any:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
@@ -5,7 +5,10 @@ Tests for the Persona-Switching Agentic Chatbot API.
 
 import uuid
 from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
 from src.api import app
+from src.graph import graph
+from src.personas import persona_manager
 
 client = TestClient(app)
 
@@ -147,4 +150,38 @@ def test_chat_missing_user_id():
 
 def test_chat_history_missing_user_id():
     response = client.get("/chat_history")
-    assert response.status_code == 422  # Validation error
\ No newline at end of file
+    assert response.status_code == 422  # Validation error
+
+def test_chat_history_etag_and_not_modified():
+    user_id = f"test_user_{uuid.uuid4().hex}"
+    thread_id = str(uuid.uuid4())
+    persona_manager.bind_thread(thread_id, user_id, "Mentor")
+    config = {"configurable": {"thread_id": thread_id}}
+    graph.update_state(config, {"messages": [HumanMessage(content="Hello mentor")]})
+
+    first = client.get(f"/chat_history?user_id={user_id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.json()["history"]["Mentor"][0]["content"] == "Hello mentor"
+
+    cached = client.get(f"/chat_history?user_id={user_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    # A new checkpoint on any thread changes the version token
+    graph.update_state(config, {"messages": [HumanMessage(content="x" * 4096)]})
+    updated = client.get(f"/chat_history?user_id={user_id}", headers={"If-None-Match": etag})
+    assert updated.status_code == 200
+    assert updated.headers["etag"] != etag
+    assert updated.headers["content-encoding"] == "gzip"
+    assert len(updated.json()["history"]["Mentor"]) == 2
+
+
+def test_stats_endpoint_reports_model_calls_and_cache():
+    response = client.get("/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data["model_calls"]) == {"classifier", "persona_prompt", "generation", "summary"}
+    assert {"calls", "timeouts", "hedges_fired", "hedge_delay_s"} <= set(data["model_calls"]["classifier"])
+    assert {"hits", "misses", "entries", "bytes"} <= set(data["checkpoint_cache"])
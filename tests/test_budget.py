@@ -0,0 +1,119 @@
+"""
+Tests for deadline-bounded and hedged model invocation.
+
+"""
+
+import itertools
+import time
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src import budget, personas
+from src.budget import DeadlineExceeded, HedgedInvoker, LatencyBudget
+
+
+class FlakyLatencyModel:
+    """Fake model whose first call is slow and later calls answer quickly."""
+
+    def __init__(self, slow: float, fast: float):
+        self.delays = itertools.chain([slow], itertools.repeat(fast))
+
+    def invoke(self, messages, timeout=None):
+        delay = next(self.delays)
+        time.sleep(delay)
+        return f"answered after {delay}s"
+
+
+def test_invoke_returns_result_within_budget():
+    invoker = HedgedInvoker("test", hedge=False)
+    model = FakeListChatModel(responses=["hello"])
+    result = invoker.invoke(model.invoke, "hi", budget=LatencyBudget(5))
+    assert result.content == "hello"
+    assert invoker.stats["calls"] == 1
+    assert invoker.stats["timeouts"] == 0
+
+
+def test_invoke_raises_when_deadline_missed():
+    invoker = HedgedInvoker("test", hedge=False)
+    model = FakeListChatModel(responses=["too late"], sleep=1.0)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        invoker.invoke(model.invoke, "hi", budget=LatencyBudget(5), timeout=0.1)
+    assert time.monotonic() - start < 0.5
+    assert invoker.stats["timeouts"] == 1
+    # The timed-out call counts towards the hedge percentile at its deadline
+    assert list(invoker._latencies) == pytest.approx([0.1], abs=0.01)
+
+
+def test_hedge_wins_over_slow_primary():
+    invoker = HedgedInvoker("test", hedge=True, initial_delay=0.05)
+    model = FlakyLatencyModel(slow=1.0, fast=0.01)
+    result = invoker.invoke(model.invoke, "hi", budget=LatencyBudget(5))
+    assert result == "answered after 0.01s"
+    assert invoker.stats["hedges_fired"] == 1
+    assert invoker.stats["hedges_won"] == 1
+
+
+def test_hedge_delay_tracks_latency_percentile():
+    invoker = HedgedInvoker("test", hedge=True, percentile=90, initial_delay=2.0, min_samples=10)
+    assert invoker.hedge_delay() == 2.0
+    invoker._latencies.extend(i / 100 for i in range(1, 11))
+    assert invoker.hedge_delay() == pytest.approx(0.09)
+
+
+def test_classifier_timeout_degrades_to_continue(monkeypatch):
+    class SlowClassifier:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def with_structured_output(self, schema):
+            return FakeListChatModel(responses=["unused"], sleep=1.0)
+
+    monkeypatch.setattr(personas, "ChatOpenAI", SlowClassifier)
+    start = time.monotonic()
+    assert personas.detect_persona_request("Act like my mentor", LatencyBudget(0.1)) == "base"
+    assert time.monotonic() - start < 0.5
+
+
+def test_slow_persona_creation_degrades_to_continue(monkeypatch):
+    created = []
+
+    class CreatingClassifier:
+        def __init__(self, *args, **kwargs):
+            created.append(kwargs)
+
+        def with_structured_output(self, schema):
+            return self
+
+        def invoke(self, messages, timeout=None):
+            if isinstance(messages, list):
+                return {"action": "create", "new_persona_name": "astronaut",
+                        "new_persona_description": "Explains space travel."}
+            time.sleep(1.0)  # the persona prompt generation
+            return "too late"
+
+    monkeypatch.setattr(personas, "ChatOpenAI", CreatingClassifier)
+    start = time.monotonic()
+    assert personas.detect_persona_request("Act like an astronaut", LatencyBudget(0.2)) == "base"
+    assert time.monotonic() - start < 0.6
+    assert "astronaut" not in personas.PERSONAS
+    assert all(kwargs.get("max_retries") == 0 for kwargs in created)
+
+
+def test_remaining_budget_is_passed_as_request_timeout():
+    seen = []
+    invoker = HedgedInvoker("test", hedge=False)
+    invoker.invoke(lambda messages, timeout=None: seen.append(timeout), "hi", budget=LatencyBudget(5), timeout=1.0)
+    assert 0 < seen[0] <= 1.0
+
+    # Without any deadline the client's own timeout is left alone
+    invoker.invoke(lambda messages, **kwargs: seen.append(kwargs), "hi")
+    assert seen[1] == {}
+
+
+def test_hedge_skipped_when_pool_saturated(monkeypatch):
+    monkeypatch.setattr(budget, "pool_saturated", lambda: True)
+    invoker = HedgedInvoker("test", hedge=True, initial_delay=0.01)
+    model = FlakyLatencyModel(slow=0.1, fast=0.01)
+    assert invoker.invoke(model.invoke, "hi", budget=LatencyBudget(5)) == "answered after 0.1s"
+    assert invoker.stats["hedges_fired"] == 0
+    assert invoker.stats["hedges_skipped"] == 1
@@ -0,0 +1,124 @@
+"""
+Tests for the in-memory checkpoint cache tier.
+
+"""
+
+import sqlite3
+import threading
+from langgraph.checkpoint.base import empty_checkpoint, create_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+from src.checkpoint_cache import ByteLRUCache, CachingSqliteSaver
+
+
+def make_saver(**kwargs):
+    saver = CachingSqliteSaver(sqlite3.connect(":memory:", check_same_thread=False), **kwargs)
+    saver.setup()
+    return saver
+
+
+def put_checkpoint(saver, thread_id, value, parent_config=None):
+    config = parent_config or {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    checkpoint = create_checkpoint(empty_checkpoint(), None, 1)
+    checkpoint["channel_values"] = {"messages": value}
+    return saver.put(config, checkpoint, {"source": "loop", "step": 1}, {})
+
+
+def test_byte_lru_cache_evicts_by_size():
+    cache = ByteLRUCache(10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    cache.get("a")
+    cache.put("c", "C", 4)
+    assert "b" not in cache
+    assert cache.current_bytes == 8
+    cache.put("huge", "H", 11)  # larger than the whole budget, never cached
+    assert "huge" not in cache
+
+
+def test_put_writes_through_and_get_hits_memory():
+    saver = make_saver()
+    config = put_checkpoint(saver, "t1", ["hello"])
+
+    saved = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert saved.checkpoint["channel_values"] == {"messages": ["hello"]}
+    assert saved.config == config
+    assert saver.stats == {"hits": 1, "misses": 0, "prefetched": 0}
+
+    # Pending writes invalidate the entry, the next read goes to SQLite
+    saver.put_writes(config, [("messages", ["world"])], "task-1")
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}).pending_writes
+    assert saver.stats["misses"] == 1
+
+
+def test_prefetch_loads_threads_into_cache():
+    saver = make_saver()
+    for thread_id in ("mentor", "investor"):
+        put_checkpoint(saver, thread_id, [thread_id])
+    saver.cache.pop(("mentor", ""))
+    saver.cache.pop(("investor", ""))
+
+    for future in saver.prefetch(["mentor", "investor", "missing"]):
+        future.result()
+
+    assert ("mentor", "") in saver.cache
+    assert ("investor", "") in saver.cache
+    assert saver.stats["prefetched"] == 2
+    saver.get_tuple({"configurable": {"thread_id": "mentor"}})
+    assert saver.stats["hits"] == 1
+
+
+def test_checkpoint_is_serialized_once_and_sized_from_sqlite():
+    saver = make_saver()
+    calls = []
+    dumps_typed = saver.serde.dumps_typed
+    saver.serde.dumps_typed = lambda obj: calls.append(obj) or dumps_typed(obj)
+
+    config = put_checkpoint(saver, "t1", ["hello"])
+    assert len(calls) == 1
+    size = saver.cache.current_bytes
+    assert size == saver._stored_size(config)
+
+    saver.cache.pop(("t1", ""))
+    saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert len(calls) == 1
+    assert saver.cache.current_bytes == size
+
+
+def test_prefetch_racing_a_newer_checkpoint_is_not_cached(monkeypatch):
+    saver = make_saver()
+    put_checkpoint(saver, "t1", ["old"])
+    saver.cache.pop(("t1", ""))
+
+    # Hold the prefetch between its SQLite read and its cache insert
+    read_done, resume = threading.Event(), threading.Event()
+    get_tuple = SqliteSaver.get_tuple
+
+    def paused_get_tuple(self, config):
+        saved = get_tuple(self, config)
+        if threading.current_thread().name.startswith("checkpoint-prefetch"):
+            read_done.set()
+            resume.wait(5)
+        return saved
+
+    monkeypatch.setattr(SqliteSaver, "get_tuple", paused_get_tuple)
+    [future] = saver.prefetch(["t1"])
+    assert read_done.wait(5)
+
+    # The graph saves a newer checkpoint and its pending writes meanwhile
+    def write_newer():
+        config = put_checkpoint(saver, "t1", ["new"])
+        saver.put_writes(config, [("messages", ["pending"])], "task-1")
+        return config
+
+    written = []
+    writer = threading.Thread(target=lambda: written.append(write_newer()))
+    writer.start()
+    writer.join(0.2)
+    resume.set()
+    future.result(5)
+    writer.join(5)
+
+    saved = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert saved.config == written[0]
+    assert saved.checkpoint["channel_values"] == {"messages": ["new"]}
+    assert saved.pending_writes
@@ -0,0 +1,61 @@
+"""
+Tests for the persistent thread -> persona index.
+
+"""
+
+from src.personas import LRUCache, PersonaManager
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recently used
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_thread_index_stays_bounded_and_falls_back_to_db(tmp_path):
+    manager = PersonaManager(db_path=str(tmp_path / "threads.db"), cache_size=4)
+    thread_ids = [manager.get_or_create_thread(f"user_{i}", "Mentor") for i in range(20)]
+
+    assert len(manager.threads.cache) == 4
+    # Evicted entries are still served from the persistent table
+    assert manager.get_persona_by_thread(thread_ids[0]) == "Mentor"
+    assert manager.get_user_threads("user_0") == {"Mentor": thread_ids[0]}
+    assert manager.get_persona_by_thread("unknown-thread") == "base"
+
+
+def test_thread_index_survives_restart(tmp_path):
+    db_path = str(tmp_path / "threads.db")
+    manager = PersonaManager(db_path=db_path, cache_size=8)
+    mentor_thread = manager.get_or_create_thread("alice", "Mentor")
+    investor_thread = manager.get_or_create_thread("alice", "Investor")
+
+    restarted = PersonaManager(db_path=db_path, cache_size=8)
+    assert restarted.get_persona_by_thread(mentor_thread) == "Mentor"
+    assert restarted.get_or_create_thread("alice", "Investor") == investor_thread
+    assert restarted.get_user_threads("alice") == {"Mentor": mentor_thread, "Investor": investor_thread}
+
+
+def test_concurrent_first_requests_share_one_thread(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    manager = PersonaManager(db_path=str(tmp_path / "threads.db"), cache_size=8)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        thread_ids = set(pool.map(lambda _: manager.get_or_create_thread("alice", "Mentor"), range(16)))
+
+    assert len(thread_ids) == 1
+    assert manager.get_user_threads("alice") == {"Mentor": thread_ids.pop()}
+
+
+def test_active_thread_survives_restart(tmp_path):
+    db_path = str(tmp_path / "threads.db")
+    manager = PersonaManager(db_path=db_path, cache_size=8)
+    mentor_thread = manager.get_or_create_thread("alice", "Mentor")
+    manager.set_active_thread("alice", mentor_thread)
+
+    assert PersonaManager(db_path=db_path, cache_size=8).get_active_thread("alice") == mentor_thread
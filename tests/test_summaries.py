@@ -0,0 +1,68 @@
+"""
+Tests for background rolling summarization of long threads.
+
+"""
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.store.memory import InMemoryStore
+from src.summaries import ThreadSummarizer
+
+
+def make_messages(count):
+    return [
+        HumanMessage(content=f"question {i}") if i % 2 == 0 else AIMessage(content=f"answer {i}")
+        for i in range(count)
+    ]
+
+
+def test_no_summary_while_thread_fits_window():
+    summarizer = ThreadSummarizer(InMemoryStore(), FakeListChatModel(responses=["unused"]), max_messages=10)
+    assert summarizer.schedule("t1", make_messages(10)) is None
+    assert summarizer.get("t1") == {"summary": "", "summarized_count": 0}
+
+
+def test_out_of_window_messages_are_folded_incrementally():
+    model = FakeListChatModel(responses=["summary v1", "summary v2"])
+    summarizer = ThreadSummarizer(InMemoryStore(), model, max_messages=10, min_new_messages=4)
+
+    # Only 2 messages out of the window: not worth a model call yet
+    assert summarizer.schedule("t1", make_messages(12)) is None
+
+    summarizer.schedule("t1", make_messages(14)).result()
+    assert summarizer.get("t1") == {"summary": "summary v1", "summarized_count": 4}
+
+    summarizer.schedule("t1", make_messages(18)).result()
+    assert summarizer.get("t1") == {"summary": "summary v2", "summarized_count": 8}
+
+
+def test_llm_call_sends_every_message_not_yet_summarized(monkeypatch):
+    from src import graph
+
+    class CapturingModel:
+        def invoke(self, messages, timeout=None):
+            self.messages = messages
+            return AIMessage(content="ok")
+
+    model = CapturingModel()
+    monkeypatch.setattr(graph, "llm_with_tools", model)
+    monkeypatch.setattr(graph.summarizer, "schedule", lambda *args: None)
+    monkeypatch.setattr(graph.summarizer, "get", lambda thread_id: {"summary": "earlier", "summarized_count": 4})
+
+    # 13 messages past the summary: more than the 10-message window, all still sent
+    graph.llm_call({"messages": make_messages(17)}, {"configurable": {"thread_id": "t1", "user_id": "u1"}})
+    assert [m.content for m in model.messages[1:]] == [m.content for m in make_messages(17)[4:]]
+    assert "earlier" in model.messages[0].content
+
+
+def test_summary_call_is_bounded_by_timeout(monkeypatch):
+    import src.summaries
+
+    monkeypatch.setattr(src.summaries, "SUMMARY_TIMEOUT_SECONDS", 0.1)
+    model = FakeListChatModel(responses=["too late"], sleep=1.0)
+    summarizer = ThreadSummarizer(InMemoryStore(), model, max_messages=10, min_new_messages=4)
+
+    result = summarizer.schedule("t1", make_messages(14)).result(timeout=0.5)
+    assert result == {"summary": "", "summarized_count": 0}
+    # The worker is free again for the next fold
+    assert "t1" not in summarizer._in_flight
@@ -0,0 +1,169 @@
+"""
+Tests for traffic recording and offline replay.
+
+"""
+
+import json
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from langgraph.store.memory import InMemoryStore
+from pydantic import BaseModel
+from src.budget import HedgedInvoker
+from src.replay import diff_reports, latency_summary, load_recording, replay
+from src.summaries import ThreadSummarizer
+from src.traffic import TrafficMiddleware, anonymize_user_id, dump_model_result, redact_model_result
+
+
+class ChatRequest(BaseModel):
+    user_id: str
+    message: str
+
+
+class LiveModel:
+    def invoke(self, messages, **kwargs):
+        raise AssertionError("replay must not call the live model")
+
+
+def make_app(model, **middleware_kwargs):
+    invoker = HedgedInvoker("generation", hedge=False)
+    app = FastAPI()
+    app.add_middleware(TrafficMiddleware, **middleware_kwargs)
+
+    @app.post("/chat")
+    def chat(request: ChatRequest):
+        reply = invoker.invoke(model.invoke, request.message)
+        return {"user_id": request.user_id, "response": reply.content, "persona": "Mentor"}
+
+    @app.get("/chat_history")
+    def chat_history(user_id: str):
+        return {"user_id": user_id, "history": {"Mentor": [{"role": "human", "content": "secret"}]}}
+
+    @app.get("/personas")
+    def personas():
+        return {"personas": []}
+
+    return app
+
+
+def test_recorder_writes_anonymized_exchanges_with_model_calls(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    client = TestClient(make_app(FakeListChatModel(responses=["recorded answer"]), record_path=str(path)))
+
+    response = client.post("/chat", json={"user_id": "alice", "message": "my plan"})
+    assert response.json()["response"] == "recorded answer"
+    client.get("/personas")  # not recorded
+    history = client.get("/chat_history", params={"user_id": "alice"})
+
+    entry, history_entry = load_recording(str(path))
+    assert entry["path"] == "/chat"
+    # Text is replaced by placeholders of the same length
+    assert entry["body"] == {"user_id": anonymize_user_id("alice"), "message": "xxxxxxx"}
+    assert entry["response"]["user_id"] == anonymize_user_id("alice")
+    assert entry["response"]["response"] == "x" * len("recorded answer")
+    assert entry["model_calls"][0]["name"] == "generation"
+    assert entry["model_calls"][0]["result"]["data"]["data"]["content"] == "x" * len("recorded answer")
+    for text in ("alice", "my plan", "recorded answer"):
+        assert text not in path.read_text()
+    # History bodies are not kept, only their size
+    assert history_entry["response"] == {"size": len(history.content)}
+    assert "secret" not in path.read_text()
+
+
+def test_replay_serves_model_calls_from_recording(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    client = TestClient(make_app(FakeListChatModel(responses=["first", "second"]), record_path=str(path)))
+    for message in ("one", "two"):
+        client.post("/chat", json={"user_id": "bob", "message": message})
+    entries = load_recording(str(path))
+
+    replay_app = make_app(LiveModel())
+    responses = []
+
+    @replay_app.middleware("http")
+    async def capture(request, call_next):
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        responses.append(json.loads(body)["response"])
+        return Response(content=body, status_code=response.status_code, headers=response.headers)
+
+    report = replay(entries, replay_app, speed=100)
+    assert report["requests"] == 2
+    assert report["latency_ms"]["/chat"]["count"] == 2
+    assert report["mismatches"] == []
+    assert responses == ["xxxxx", "xxxxxx"]
+
+
+def test_routing_fields_of_structured_output_are_kept():
+    class Decision(BaseModel):
+        thinking: str
+        action: str
+        new_persona_name: str
+        new_persona_description: str
+
+    decision = Decision(thinking="user wants space advice", action="create",
+                        new_persona_name="astronaut", new_persona_description="Knows rockets.")
+    recorded = redact_model_result(dump_model_result(decision))["data"]
+    assert recorded == {"thinking": "x" * 23, "action": "create", "new_persona_name": "astronaut",
+                        "new_persona_description": "x" * 14}
+
+
+def make_summarizing_app(summary_model, **middleware_kwargs):
+    summarizer = ThreadSummarizer(InMemoryStore(), summary_model, max_messages=1, min_new_messages=1)
+    app = FastAPI()
+    app.add_middleware(TrafficMiddleware, **middleware_kwargs)
+
+    @app.post("/chat")
+    def chat(request: ChatRequest):
+        summarizer.schedule("thread-1", [HumanMessage(content="earlier"), HumanMessage(content=request.message)])
+        return {"user_id": request.user_id, "response": "ok", "persona": "Mentor"}
+
+    return app, summarizer
+
+
+def test_background_summary_is_recorded_with_its_request_and_replayed(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    # The summary finishes well after the response has been sent
+    app, _ = make_summarizing_app(FakeListChatModel(responses=["the summary"], sleep=0.3), record_path=str(path))
+    TestClient(app).post("/chat", json={"user_id": "dave", "message": "hi"})
+
+    [entry] = load_recording(str(path))
+    assert [call["name"] for call in entry["model_calls"]] == ["summary"]
+
+    replay_app, summarizer = make_summarizing_app(LiveModel())
+    report = replay([entry], replay_app, speed=100)
+    summarizer._pool.shutdown(wait=True)
+    assert report["mismatches"] == []
+    assert summarizer.get("thread-1") == {"summary": "x" * len("the summary"), "summarized_count": 1}
+
+
+def test_latency_summary_and_diff():
+    baseline = {"latency_ms": latency_summary({"/chat": [10.0, 20.0, 30.0]})}
+    current = {"latency_ms": latency_summary({"/chat": [20.0, 40.0, 60.0]})}
+    assert baseline["latency_ms"]["/chat"]["p50"] == 20.0
+    diff = diff_reports(baseline, current)
+    assert diff["/chat"]["p50"] == {"baseline": 20.0, "current": 40.0, "change_pct": 100.0}
+
+
+def test_conditional_polls_are_replayed_with_the_latest_etag(tmp_path):
+    from src import api
+
+    path = tmp_path / "traffic.jsonl"
+    app = FastAPI()
+    app.add_middleware(TrafficMiddleware, record_path=str(path))
+    app.get("/chat_history")(api.get_chat_history)
+    client = TestClient(app)
+
+    first = client.get("/chat_history", params={"user_id": "carol"})
+    polled = client.get("/chat_history", params={"user_id": "carol"},
+                        headers={"If-None-Match": first.headers["etag"]})
+    assert polled.status_code == 304
+
+    entries = load_recording(str(path))
+    assert [e["conditional"] for e in entries] == [False, True]
+
+    replay_app = FastAPI()
+    replay_app.get("/chat_history")(api.get_chat_history)
+    report = replay(entries, replay_app, speed=100)
+    assert report["mismatches"] == []